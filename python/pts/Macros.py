@@ -26,6 +26,7 @@ class Macros:
     results_dir: Path = project_dir / "results"
     repos_downloads_dir: Path = project_dir / "_downloads"
     repos_results_dir: Path = project_dir / "_results"
+    repos_object_cache_dir: Path = project_dir / "_object-cache.git"
     docs_dir: Path = project_dir / "docs"
     ml_logs_dir: Path = python_dir / "ml-logs"
     config_dir: Path = python_dir / "configs"
@@ -1,18 +1,26 @@
 from typing import *
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
+import io
 import re
 from tqdm import tqdm
 import traceback
 from recordclass import asdict
-from urllib.error import HTTPError
-from urllib.request import urlopen
+import requests
+from requests.adapters import HTTPAdapter, Retry
 from xml.etree import ElementTree
 import shutil
+import subprocess
 import os
-from contextlib import contextmanager
+import time
+import uuid
+import atexit
+import functools
+import threading
 
-from seutil import LoggingUtils, IOUtils, BashUtils, TimeUtils, GitHubUtils
+from seutil import LoggingUtils, IOUtils, GitHubUtils
 from seutil.project import Project
 
 from pts.Environment import Environment
@@ -21,27 +29,208 @@ from pts.data.ProjectData import ProjectData
 from pts.Utils import Utils
 
 
-@contextmanager
-def change_dir(destination: Path):
+# One keep-alive session for all probes, so that the TLS handshakes with github.com hosts are amortized
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32,
+                                       max_retries=Retry(total=3, backoff_factor=0.3)))
+_SESSION.headers["User-Agent"] = "pts-collector"
+_GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN", GitHubUtils.DEFAULT_ACCESS_TOKEN)
+if _GITHUB_TOKEN:
+    _SESSION.headers["Authorization"] = f"token {_GITHUB_TOKEN}"
+
+
+def _run(cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
     """
-    Context manager for changing the current working directory.
-    Automatically returns to the original directory after the operation.
+    Runs the command directly, without going through a shell.
+    :raises RuntimeError: if the command returns non-zero; the message includes its stderr.
     """
-    original_dir = Path.cwd()
     try:
-        os.chdir(destination)
-        yield
-    finally:
-        os.chdir(original_dir)
+        return subprocess.run(cmd, check=True, capture_output=True, text=True, **kwargs)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Command {cmd} returned {e.returncode}.\nstdout: {e.stdout}\nstderr: {e.stderr}") from e
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_repo_name(project_name: str) -> str:
+    github_user_name, github_project_name = project_name.split('_', 1)
+    return f"https://github.com/{github_user_name}/{github_project_name}.git"
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_github_url(github_url: str) -> Optional[Tuple[str, str]]:
+    prefix = "https://github.com/"
+    if not github_url.startswith(prefix):
+        return None
+    user_repo = github_url[len(prefix):]
+    if user_repo.endswith(".git"):
+        user_repo = user_repo[:-len(".git")]
+    parts = user_repo.split("/")
+    if len(parts) != 2 or not parts[0] or not parts[1]:
+        return None
+    return parts[0], parts[1]
 
 
 class DataCollector:
     logger = LoggingUtils.get_logger(__name__, LoggingUtils.DEBUG if Environment.is_debug else LoggingUtils.INFO)
 
+    # Clones are bound by the remote, not the local CPU, so use most of the cores (4 if unknown)
+    NUM_WORKERS = max(1, 3 * os.cpu_count() // 4) if os.cpu_count() else 4
+    CLONE_TIMEOUT = 300
+    # Never prompt for credentials (would hang on private/deleted repos), and let git use threads for fetching
+    # submodules and resolving deltas, splitting the cores among the NUM_WORKERS concurrent clones
+    GIT_JOBS = max(1, (os.cpu_count() or 4) // NUM_WORKERS)
+    GIT = ["git", "-c", "protocol.version=2", "-c", f"fetch.parallel={GIT_JOBS}",
+           "-c", f"submodule.fetchJobs={GIT_JOBS}", "-c", f"pack.threads={GIT_JOBS}", "-c", "core.fsmonitor=false"]
+    GIT_ENV = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    # Partial clone: commits and trees only, blobs are fetched lazily on checkout
+    GIT_CLONE_FLAGS = ["--filter=blob:none", "--no-tags", "--single-branch"]
+    # The Java collector is CPU bound; at most this many run alongside the clones
+    NUM_COLLECTORS = max(1, os.cpu_count() // 2) if os.cpu_count() else 2
+
     def __init__(self):
         self.repos_downloads_dir: Path = Macros.repos_downloads_dir
         self.repos_results_dir: Path = Macros.repos_results_dir
+        # Shared bare repo that clones of forks borrow their upstream's objects from
+        self.object_cache_dir: Path = Macros.repos_object_cache_dir
+        self._object_cache_lock = threading.Lock()
+        self._upstream_locks: Dict[str, threading.Lock] = {}
+        # Upstreams that several projects of the current batch are forked from, see _find_shared_upstreams
+        self._shared_upstreams: Set[str] = set()
         self.collected_projects_list = []
+        # Mirrors collected_projects_list for constant time lookups in is_project_collected
+        self._collected_names = set()
+        self._collected_urls = set()
+        self._collected_lock = threading.Lock()
+        # Appended to as soon as each project is collected, so that an interrupted run can be resumed
+        self._collected_file = Macros.results_dir / "collected-projects.txt"
+        self._collected_fh = None
+        if self._collected_file.exists():
+            for project_url in IOUtils.load(self._collected_file, IOUtils.Format.txt).splitlines():
+                self._add_collected(project_url)
+        self._gc_pool = ThreadPoolExecutor(max_workers=2)
+        # Finish deletions that an earlier, interrupted run left behind
+        for parent in (self.repos_results_dir, self.repos_downloads_dir):
+            if parent.exists():
+                for trash in parent.glob("*.trash-*"):
+                    self._gc_pool.submit(shutil.rmtree, trash, ignore_errors=True)
+        self._collector_slots = threading.BoundedSemaphore(self.NUM_COLLECTORS)
+        self._collector_pool = ThreadPoolExecutor(max_workers=self.NUM_COLLECTORS)
+        self._pending = []
+
+    def close(self):
+        """
+        Waits for the running Java collectors and the pending background deletions, and closes collected-projects.txt.
+        Safe to call more than once, and on a partially initialized collector.  Use the collector in a with block to
+        have it called.
+        """
+        for pool in (getattr(self, "_collector_pool", None), getattr(self, "_gc_pool", None)):
+            if pool is not None:
+                pool.shutdown(wait=True)
+        if getattr(self, "_collected_fh", None) is not None:
+            self._collected_fh.close()
+            self._collected_fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _clone_reference_flags(self, project_url: str) -> List[str]:
+        """
+        If the project is forked from an upstream shared within the batch, makes sure the upstream is in the object
+        cache and returns the flags for cloning with the objects borrowed from there; otherwise returns no flags.
+        With --dissociate the borrowed objects are copied, so the clones stay usable if the cache is deleted.
+        """
+        upstream_url = self._safe_fork_upstream_url(project_url)
+        if upstream_url not in self._shared_upstreams or not self.update_object_cache([upstream_url]):
+            return []
+        return ["--reference-if-able", str(self.object_cache_dir), "--dissociate"]
+
+    def _find_shared_upstreams(self, executor: ThreadPoolExecutor, project_urls: List[str]):
+        """
+        Finds the upstreams that at least two of the projects are forked from.  Only those are worth fetching into the
+        object cache: a full fetch of the upstream costs more than the partial clone of a single fork.
+        The repo lookups are cached, so the liveness checks during the collection reuse them.
+        """
+        upstream_counts = Counter(u for u in executor.map(self._safe_fork_upstream_url, project_urls) if u is not None)
+        self._shared_upstreams = {u for u, count in upstream_counts.items() if count >= 2}
+
+    @classmethod
+    def _safe_fork_upstream_url(cls, project_url: str) -> Optional[str]:
+        # A failed lookup only means no object cache for this clone; the liveness check reports the failure
+        try:
+            return cls.get_fork_upstream_url(project_url)
+        except Exception:
+            return None
+
+    @classmethod
+    def get_fork_upstream_url(cls, project_url: str) -> Optional[str]:
+        """Returns the clone url of the repo the project is (transitively) forked from, or None if it is not a fork."""
+        repo_info = cls.get_repo_info(project_url)
+        return repo_info["source"] if repo_info is not None else None
+
+    def update_object_cache(self, project_urls: List[str]) -> bool:
+        """
+        Fetches the default branches of the given upstream repos into the object cache, unless already there.
+        Fetches of different upstreams run concurrently; only fetches of the same upstream wait for each other.
+        :return: whether all of them are in the cache.
+        """
+        with self._object_cache_lock:
+            if not self.object_cache_dir.exists():
+                self._git("init", "--bare", self.object_cache_dir)
+
+        all_cached = True
+        for project_url in project_urls:
+            user_repo = self.parse_github_url(project_url)
+            if user_repo is None:
+                self.logger.warning(f"URL {project_url} is not a valid GitHub repo URL.")
+                all_cached = False
+                continue
+            ref = f"refs/cache/{user_repo[0]}_{user_repo[1]}"
+            with self._object_cache_lock:
+                upstream_lock = self._upstream_locks.setdefault(ref, threading.Lock())
+            with upstream_lock:
+                try:
+                    self._git("-C", self.object_cache_dir, "rev-parse", "--verify", "--quiet", ref)
+                    continue
+                except RuntimeError:
+                    pass
+                try:
+                    self._git("-C", self.object_cache_dir, "fetch", "--no-tags", project_url, f"+HEAD:{ref}",
+                              timeout=self.CLONE_TIMEOUT)
+                except Exception:
+                    self.logger.warning(f"Fetching {project_url} into the object cache failed, error was: {traceback.format_exc()}")
+                    all_cached = False
+        return all_cached
+
+    def _async_rmtree(self, path: Path):
+        """
+        Moves the directory out of the way and deletes it in the background, so that the caller can recreate it right away.
+        """
+        trash = path.with_name(f"{path.name}.trash-{uuid.uuid4().hex}")
+        try:
+            path.rename(trash)
+        except FileNotFoundError:
+            return
+        self._gc_pool.submit(shutil.rmtree, trash, ignore_errors=True)
+
+    @classmethod
+    def _git(cls, *args, **kwargs) -> subprocess.CompletedProcess:
+        return _run([*cls.GIT, *map(str, args)], env=cls.GIT_ENV, **kwargs)
+
+    def _clone(self, project_url: str, project_name: str, *flags):
+        """
+        Clones the project into repos_downloads_dir, within CLONE_TIMEOUT.
+        On timeout git is killed mid-clone, so the half-written directory is removed before re-raising; otherwise it
+        would look downloaded to later runs.
+        """
+        try:
+            self._git("-C", self.repos_downloads_dir, "clone", *flags, project_url, project_name,
+                      timeout=self.CLONE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self._async_rmtree(self.repos_downloads_dir / project_name)
+            raise
 
     def collect_data(self, **options):
         which = Utils.get_option_as_list(options, "which")
@@ -70,15 +259,18 @@ class DataCollector:
             pp.parse_project(project, revision)
             self.collect_test_methods_with_shas(project, revision)
 
+    RE_TEST_PATH = re.compile(r"src/test|Test\.java")
+
     def collect_test_methods_with_shas(self, project: str, revision: str):
         from collections import defaultdict
         project_result_dir = self.repos_results_dir / project / revision / "collector"
         project_method_file = project_result_dir / "method-data.json"
-        method_list = IOUtils.load(project_method_file)
+        is_test = self.RE_TEST_PATH.search
         test_class_2_methods = defaultdict(list)
-        for m in method_list:
-            if "src/test" in m["path"] or "Test.java" in m["path"]:
-                class_name = m["path"].split('/')[-1].split('.java')[0]
+        for m in IOUtils.load_json_stream(project_method_file):
+            path = m["path"]
+            if is_test(path):
+                class_name = path.rpartition('/')[2].split('.java')[0]
                 test_class_2_methods[class_name].append(m["id"])
 
         IOUtils.dump(project_result_dir / "test2methods.json", test_class_2_methods)
@@ -86,13 +278,13 @@ class DataCollector:
     def collect_test_method(self, **options):
         from collections import defaultdict
         projects = Utils.get_option_as_list(options, "projects")
+        is_test = self.RE_TEST_PATH.search
         for project in projects:
             project_result_dir = self.repos_results_dir / project / "collector"
             project_method_file = project_result_dir / "method-data.json"
-            method_list = IOUtils.load(project_method_file)
             test_class_2_methods = defaultdict(list)
-            for m in method_list:
-                if "src/test" in m["path"] or "Test.java" in m["path"]:
+            for m in IOUtils.load_json_stream(project_method_file):
+                if is_test(m["path"]):
                     test_class_2_methods[m["class_name"]].append(m["id"])
 
             IOUtils.dump(project_result_dir / "test2methods.json", test_class_2_methods)
@@ -101,42 +293,60 @@ class DataCollector:
         projects = Utils.get_option_as_list(options, "projects")
         shas = Utils.get_option_as_list(options, "shas")
         num_sha = options.get("num_sha", 20)
-        proj_dict = {}
-        for p, sh in zip(projects, shas):
-            proj_dict[p] = sh
+        proj_dict = dict(zip(projects, shas))
 
         from pts.collector.eval_data_collection import main
         main(proj_dict)
 
     def download_projects(self, project_list: Dict):
-        for project, sha in tqdm(project_list.items(), total=len(project_list)):
+        with ThreadPoolExecutor(self.NUM_WORKERS) as executor:
+            self._find_shared_upstreams(executor, [self.parse_repo_name(project) for project in project_list
+                                                   if "_" in project])
+            futures = [executor.submit(self._download_one, project, sha) for project, sha in project_list.items()]
             try:
-                project_url = self.parse_repo_name(project)
-
-                if not self.check_github_url(project_url):
-                    self.logger.warning(f"Project {project} no longer available.")
-                    continue
-
-                downloads_dir = self.repos_downloads_dir / project
-                results_dir = self.repos_results_dir / project
-
-                shutil.rmtree(results_dir, ignore_errors=True)
-                results_dir.mkdir(parents=True, exist_ok=True)
-
-                if not downloads_dir.exists():
-                    with change_dir(self.repos_downloads_dir):
-                        with TimeUtils.time_limit(300):
-                            BashUtils.run(f"git clone {project_url} {project}", expected_return_code=0)
-                        if downloads_dir.exists():
-                            with change_dir(downloads_dir):
-                                BashUtils.run(f"git checkout {sha}", expected_return_code=0)
-                        else:
-                            self.logger.warning(f"{project} is not downloaded!")
+                for f in tqdm(as_completed(futures), total=len(futures)):
+                    f.result()
             except KeyboardInterrupt:
                 self.logger.warning(f"KeyboardInterrupt")
-                break
-            except Exception:
-                self.logger.warning(f"Collection for project {project_url} failed, error was: {traceback.format_exc()}")
+                for f in futures:
+                    f.cancel()
+
+    def _download_one(self, project: str, sha: str) -> Tuple[str, bool]:
+        """
+        Downloads one project and checks out the given sha.
+        Runs in a worker thread, thus passes the directories to git explicitly instead of changing the cwd.
+        :return: the project name, and whether the project is available locally.
+        """
+        project_url = None
+        try:
+            project_url = self.parse_repo_name(project)
+
+            if not self.check_github_url(project_url):
+                self.logger.warning(f"Project {project} no longer available.")
+                return project, False
+
+            downloads_dir = self.repos_downloads_dir / project
+            results_dir = self.repos_results_dir / project
+
+            self._async_rmtree(results_dir)
+            results_dir.mkdir(parents=True, exist_ok=True)
+
+            if not downloads_dir.exists():
+                self._clone(project_url, project, *self._clone_reference_flags(project_url), *self.GIT_CLONE_FLAGS)
+                if downloads_dir.exists():
+                    try:
+                        self._git("-C", downloads_dir, "checkout", sha)
+                    except RuntimeError:
+                        # The sha is not on the default branch; fetch just that commit
+                        self._git("-C", downloads_dir, "fetch", "--depth=1", "origin", sha)
+                        self._git("-C", downloads_dir, "checkout", "FETCH_HEAD")
+                else:
+                    self.logger.warning(f"{project} is not downloaded!")
+                    return project, False
+            return project, True
+        except Exception:
+            self.logger.warning(f"Collection for project {project_url} failed, error was: {traceback.format_exc()}")
+            return project, False
 
     def collect_projects(self, project_urls_file: Path, skip_collected: bool, beg: int = None, cnt: int = None):
         project_urls = IOUtils.load(project_urls_file, IOUtils.Format.txt).splitlines()
@@ -147,70 +357,103 @@ class DataCollector:
 
         project_urls = project_urls[beg:beg + cnt]
 
-        for pi, project_url in enumerate(project_urls):
-            self.logger.info(f"Project {beg + pi + 1}/{len(project_urls)}({beg}-{beg + cnt}): {project_url}")
-
+        # Build the collector once up front, instead of racing mvn builds in the workers
+        self.require_collector()
+        with ThreadPoolExecutor(self.NUM_WORKERS) as executor:
+            self._find_shared_upstreams(executor, [project_url for project_url in project_urls
+                                                   if not (skip_collected and project_url in self._collected_urls)])
+            futures = [executor.submit(self._collect_one, project_url, skip_collected,
+                                       f"{beg + pi + 1}/{len(project_urls)}({beg}-{beg + cnt})")
+                       for pi, project_url in enumerate(project_urls)]
             try:
-                user_repo = self.parse_github_url(project_url)
-                if user_repo is None:
-                    self.logger.warning(f"URL {project_url} is not a valid GitHub repo URL.")
-                    invalid_project_urls.append(project_url)
-                    continue
+                for f in tqdm(as_completed(futures), total=len(futures)):
+                    project_url, is_valid = f.result()
+                    if not is_valid:
+                        invalid_project_urls.append(project_url)
+            except KeyboardInterrupt:
+                self.logger.warning(f"KeyboardInterrupt")
+                for f in futures:
+                    f.cancel()
 
-                project_name = f"{user_repo[0]}_{user_repo[1]}"
+        self.wait_collectors()
 
-                if skip_collected and self.is_project_collected(project_name, project_url):
-                    self.logger.info(f"Project {project_name} already collected.")
-                    continue
+    def _collect_one(self, project_url: str, skip_collected: bool, progress: str = "") -> Tuple[str, bool]:
+        """
+        Probes and collects one project; runs in a worker thread.
+        :return: the project url, and whether the url points to a valid, available GitHub repo.
+        """
+        self.logger.info(f"Project {progress}: {project_url}")
+        try:
+            user_repo = self.parse_github_url(project_url)
+            if user_repo is None:
+                self.logger.warning(f"URL {project_url} is not a valid GitHub repo URL.")
+                return project_url, False
+
+            project_name = f"{user_repo[0]}_{user_repo[1]}"
+
+            if skip_collected and self.is_project_collected(project_name, project_url):
+                self.logger.info(f"Project {project_name} already collected.")
+                return project_url, True
 
+            # A pom.xml implies the repo is alive, so the liveness probe is only needed when it is missing
+            if not self.check_maven_project(*user_repo):
                 if not self.check_github_url(project_url):
                     self.logger.warning(f"Project {project_name} no longer available.")
-                    invalid_project_urls.append(project_url)
-                    continue
+                    return project_url, False
+                self.logger.info(f"Project {project_name} does not seem to be a Maven project. Moving to nouse set")
+                return project_url, True
 
-                pom_xml_url = project_url[:-len(".git")] + "/blob/master/pom.xml"
-                try:
-                    urlopen(pom_xml_url)
-                except HTTPError:
-                    self.logger.info(f"Project {project_name} does not seem to be a Maven project. Moving to nouse set")
-                    continue
+            self.collect_project(project_name, project_url)
+        except Exception:
+            self.logger.warning(f"Collection for project {project_url} failed, error was: {traceback.format_exc()}")
+        return project_url, True
 
-                self.collect_project(project_name, project_url)
-            except KeyboardInterrupt:
-                self.logger.warning(f"KeyboardInterrupt")
-                break
-            except:
-                self.logger.warning(f"Collection for project {project_url} failed, error was: {traceback.format_exc()}")
+    _require_collector_lock = threading.Lock()
 
-        IOUtils.dump(Macros.results_dir / "collected-projects.txt", self.collected_projects_list, IOUtils.Format.txt)
+    @classmethod
+    def require_collector(cls):
+        """Thread-safe Environment.require_collector, which changes the cwd and builds the collector."""
+        with cls._require_collector_lock:
+            Environment.require_collector()
 
     def collect_project(self, project_name: str, project_url: str):
-        Environment.require_collector()
+        self.require_collector()
 
         downloads_dir = self.repos_downloads_dir / project_name
         results_dir = self.repos_results_dir / project_name
 
-        shutil.rmtree(results_dir, ignore_errors=True)
-        results_dir.mkdir(parents=True, exist_ok=True)
+        self._async_rmtree(results_dir)
 
-        if not downloads_dir.exists():
-            with change_dir(self.repos_downloads_dir):
-                with TimeUtils.time_limit(300):
-                    BashUtils.run(f"git clone {project_url} {project_name}", expected_return_code=0)
+        if downloads_dir.exists():
+            # Check the checkout that the collector will analyze
+            pom_file = downloads_dir / "pom.xml"
+            satisfied = pom_file.exists() and self.check_junit(pom_file)
+        else:
+            # Check the dependencies on the remote pom.xml, so that projects not using JUnit 4 are never cloned
+            user, repo = self.parse_github_url(project_url)
+            r = self._github_request("GET", f"https://raw.githubusercontent.com/{user}/{repo}/HEAD/pom.xml")
+            if r.status_code == 404:
+                satisfied = False
+            elif r.status_code != 200:
+                raise RuntimeError(f"Fetching pom.xml of project {project_name} returned {r.status_code}.")
+            else:
+                satisfied = self.check_junit(r.content)
 
-        if not self.check_junit(downloads_dir / "pom.xml"):
+        if not satisfied:
             self.logger.info(f"Project {project_name} does not satisfy the dependency requirements.")
-            shutil.rmtree(downloads_dir, ignore_errors=True)
-            shutil.rmtree(results_dir, ignore_errors=True)
+            self._async_rmtree(downloads_dir)
             return
 
+        results_dir.mkdir(parents=True, exist_ok=True)
+
         project_data = ProjectData.create()
         project_data.name = project_name
         project_data.url = project_url
 
-        with change_dir(downloads_dir):
-            git_log_out = BashUtils.run(f"git rev-parse HEAD", expected_return_code=0).stdout
-            project_data.revision = git_log_out
+        if not downloads_dir.exists():
+            self._clone(project_url, project_name, *self._clone_reference_flags(project_url), "--depth=1",
+                        *self.GIT_CLONE_FLAGS)
+        project_data.revision = self._git("-C", downloads_dir, "rev-parse", "HEAD").stdout.strip()
 
         project_data_file = results_dir / "project.json"
         IOUtils.dump(project_data_file, asdict(project_data), IOUtils.Format.jsonPretty)
@@ -228,72 +471,256 @@ class DataCollector:
         config_file = results_dir / "collector-config.json"
         IOUtils.dump(config_file, config, IOUtils.Format.jsonPretty)
 
+        # Don't wait for the collector, so that the next clone overlaps with it; blocks only if too many are running
+        self._collector_slots.acquire()
         self.logger.info(f"Starting the Java collector. Check log at {log_file} and outputs at {output_dir}")
-        rr = BashUtils.run(f"java -jar {Environment.collector_jar} {config_file}", expected_return_code=0)
-        if rr.stderr:
-            self.logger.warning(f"Stderr of collector:\n{rr.stderr}")
+        try:
+            p = subprocess.Popen(["java", "-jar", str(Environment.collector_jar), str(config_file)],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except:
+            self._collector_slots.release()
+            raise
+        with self._collected_lock:
+            self._pending.append(self._collector_pool.submit(self._reap_collector, project_name, project_url, p))
+
+    def _reap_collector(self, project_name: str, project_url: str, p: subprocess.Popen):
+        try:
+            _, stderr = p.communicate()
+        finally:
+            self._collector_slots.release()
+        stderr = stderr.decode("utf-8", errors="ignore")
+
+        if p.returncode != 0:
+            self.logger.warning(f"Java collector for project {project_name} failed with return code {p.returncode}, stderr:\n{stderr}")
+            return
+        if stderr:
+            self.logger.warning(f"Stderr of collector:\n{stderr}")
+
+        with self._collected_lock:
+            self._add_collected(project_url)
+            if self._collected_fh is None:
+                self._collected_file.parent.mkdir(parents=True, exist_ok=True)
+                self._collected_fh = open(self._collected_file, "a", buffering=1)
+            self._collected_fh.write(project_url + "\n")
 
+    def _add_collected(self, project_url: str):
         self.collected_projects_list.append(project_url)
+        self._collected_urls.add(project_url)
+        user_repo = self.parse_github_url(project_url)
+        if user_repo is not None:
+            self._collected_names.add(f"{user_repo[0]}_{user_repo[1]}")
+
+    def wait_collectors(self):
+        """Waits for all Java collectors started by collect_project to finish."""
+        with self._collected_lock:
+            pending, self._pending = self._pending, []
+        for f in pending:
+            f.result()
 
     REQUIREMENTS = {
         "junit": lambda v: int(v) == 4
     }
 
     @classmethod
-    def check_junit(cls, pom_file: Path) -> bool:
-        namespaces = {'xmlns': 'http://maven.apache.org/POM/4.0.0'}
-
-        tree = ElementTree.parse(pom_file)
-        root = tree.getroot()
-
-        deps = root.findall(".//xmlns:dependency", namespaces=namespaces)
-        for d in deps:
-            artifact_id = d.find("xmlns:artifactId", namespaces=namespaces).text
-            if artifact_id in cls.REQUIREMENTS.keys():
-                version = d.find("xmlns:version", namespaces=namespaces).text.split(".")[0]
-                if cls.REQUIREMENTS[artifact_id](version):
-                    return True
-                else:
-                    return False
-        return False
+    def check_junit(cls, pom: Union[Path, str, bytes]) -> bool:
+        """
+        Checks if the project depends on JUnit 4, deciding on the first dependency listed in REQUIREMENTS.
+        Parses the pom.xml incrementally and stops as soon as that dependency is seen.
+        :param pom: the path to the pom.xml file, or its content.
+        """
+        if isinstance(pom, Path):
+            data = pom.read_bytes()
+        else:
+            data = pom.encode() if isinstance(pom, str) else pom
 
-    RE_GITHUB_URL = re.compile(r"https://github\.com/(?P<user>[^/]+)/(?P<repo>.+?)(\.git)?")
+        # Most poms never mention junit; an artifactId of exactly "junit" must appear as ">junit<" in the raw bytes
+        if b">junit<" not in data:
+            return False
+
+        path = []
+        artifact_id = version = None
+        for event, elem in ElementTree.iterparse(io.BytesIO(data), events=("start", "end")):
+            tag = elem.tag.rpartition("}")[2]
+            if event == "start":
+                path.append(tag)
+                if tag == "dependency":
+                    artifact_id = version = None
+                continue
+
+            path.pop()
+            if path and path[-1] == "dependency":
+                if tag == "artifactId":
+                    artifact_id = elem.text
+                elif tag == "version":
+                    version = elem.text
+            elif tag == "dependency":
+                if artifact_id in cls.REQUIREMENTS:
+                    return cls.REQUIREMENTS[artifact_id](version.split(".")[0])
+                elem.clear()
+        return False
 
     @classmethod
     def parse_repo_name(cls, project_name):
-        github_user_name = project_name.split('_')[0]
-        github_project_name = project_name.split('_')[1]
+        return _parse_repo_name(project_name)
 
-        github_url = f"https://github.com/{github_user_name}/{github_project_name}.git"
+    @classmethod
+    def parse_github_url(cls, github_url) -> Tuple[str, str]:
+        return _parse_github_url(github_url)
 
-        return github_url
+    def is_project_collected(self, project_name, project_url):
+        return project_name in self._collected_names or project_url in self._collected_urls
 
     @classmethod
-    def parse_github_url(cls, github_url) -> Tuple[str, str]:
-        m = cls.RE_GITHUB_URL.fullmatch(github_url)
-        if m is None:
+    def check_github_url(cls, github_url):
+        return cls.get_repo_info(github_url) is not None
+
+    @classmethod
+    def get_repo_info(cls, github_url) -> Optional[Dict]:
+        """
+        Looks up the repo with a single GET /repos/{owner}/{repo}, which answers both if it is alive and what it is
+        forked from.  Definite answers are cached like check_url's.
+        :return: None if the repo is gone, otherwise {"source": the clone url of the repo it is (transitively) forked
+            from, or None if it is not a fork}.
+        :raises RuntimeError: if the answer is unknown, i.e., still rate limited after retrying, or a server error.
+        """
+        user_repo = cls.parse_github_url(github_url)
+        if user_repo is None:
             return None
+        url = f"{cls.GITHUB_API}/repos/{user_repo[0]}/{user_repo[1]}"
+        cached = cls._load_probe(url)
+        # Entries cached by the former HEAD probe only say True, without the fork information
+        if cached is False or isinstance(cached, dict):
+            return cached or None
+
+        r = cls._github_request("GET", url)
+        if r.status_code == 200:
+            repo = r.json()
+            repo_info = {"source": repo["source"]["clone_url"] if repo.get("fork") and "source" in repo else None}
+        elif cls._is_missing(r):
+            repo_info = False
         else:
-            return m.group("user"), m.group("repo")
+            raise RuntimeError(f"Probing {url} returned {r.status_code}, cannot tell if it is reachable.")
 
-    def is_project_collected(self, project_name, project_url):
-        return project_name in self.collected_projects_list or project_url in self.collected_projects_list
+        cls._save_probe(url, repo_info)
+        return repo_info or None
 
     @classmethod
-    def check_github_url(cls, github_url):
-        try:
-            urlopen(github_url)
-            return True
-        except HTTPError:
-            return False
+    def check_maven_project(cls, user: str, repo: str) -> bool:
+        """Checks if the repo has a pom.xml at its root, on the default branch."""
+        return cls.check_url(f"{cls.GITHUB_API}/repos/{user}/{repo}/contents/pom.xml")
+
+    GITHUB_API = "https://api.github.com"
+    GITHUB_API_MAX_RETRIES = 5
 
-    def get_github_top_repos(self):
+    URL_PROBE_CACHE_FILE = Macros.results_dir / "url-probe-cache.json"
+    _url_probe_cache: Dict[str, Union[bool, Dict]] = None
+    _url_probe_lock = threading.Lock()
+
+    @classmethod
+    def check_url(cls, url: str) -> bool:
+        """
+        Checks if the url is reachable, with a HEAD request so that the page itself is not downloaded.
+        Definite answers (reachable, or 404/410/non-rate-limit 403) are persisted in URL_PROBE_CACHE_FILE across runs.
+        :raises RuntimeError: if the answer is unknown, i.e., still rate limited after retrying, or a server error.
+        """
+        cached = cls._load_probe(url)
+        if cached is not None:
+            return cached
+
+        r = cls._github_request("HEAD", url)
+        if r.status_code < 400:
+            reachable = True
+        elif cls._is_missing(r):
+            reachable = False
+        else:
+            raise RuntimeError(f"Probing {url} returned {r.status_code}, cannot tell if it is reachable.")
+
+        cls._save_probe(url, reachable)
+        return reachable
+
+    @classmethod
+    def _is_missing(cls, r: requests.Response) -> bool:
+        """Checks if the response definitely says the resource is not there: missing, or blocked/disabled."""
+        return r.status_code in (404, 410) or (r.status_code == 403 and cls._rate_limit_wait(r, 0) is None)
+
+    @classmethod
+    def _load_probe(cls, url: str) -> Optional[Union[bool, Dict]]:
+        with cls._url_probe_lock:
+            if cls._url_probe_cache is None:
+                cls._url_probe_cache = IOUtils.load(cls.URL_PROBE_CACHE_FILE) if cls.URL_PROBE_CACHE_FILE.exists() else {}
+                atexit.register(cls._dump_url_probe_cache)
+            return cls._url_probe_cache.get(url)
+
+    @classmethod
+    def _save_probe(cls, url: str, answer: Union[bool, Dict]):
+        with cls._url_probe_lock:
+            cls._url_probe_cache[url] = answer
+
+    @classmethod
+    def _github_request(cls, method: str, url: str) -> requests.Response:
+        """
+        Sends a request through the shared keep-alive session, authenticated with $GITHUB_TOKEN (or seutil's
+        configured token) if available.  Connection errors are retried by the session; when rate limited, waits as
+        told by Retry-After or X-RateLimit-Reset, or backs off exponentially, and retries.
+        """
+        for retry in range(cls.GITHUB_API_MAX_RETRIES):
+            r = _SESSION.request(method, url, allow_redirects=True, timeout=10)
+            wait_seconds = cls._rate_limit_wait(r, retry)
+            if wait_seconds is None or retry == cls.GITHUB_API_MAX_RETRIES - 1:
+                break
+            cls.logger.warning(f"Rate limited on {url}, will wait for {wait_seconds:.0f} seconds.")
+            time.sleep(wait_seconds)
+        return r
+
+    @classmethod
+    def _rate_limit_wait(cls, r: requests.Response, retry: int) -> Optional[float]:
+        """
+        Returns the seconds to wait before retrying if the response is a rate limit, or None otherwise
+        (e.g., a 403 for a blocked repo).
+        """
+        if r.status_code not in (403, 429):
+            return None
+        if "Retry-After" in r.headers:
+            # Secondary rate limit
+            return float(r.headers["Retry-After"])
+        if r.headers.get("X-RateLimit-Remaining") == "0":
+            if "X-RateLimit-Reset" in r.headers:
+                return max(int(r.headers["X-RateLimit-Reset"]) - time.time(), 0) + 1
+            return 2 ** retry
+        if r.status_code == 429:
+            return 2 ** retry
+        return None
+
+    @classmethod
+    def _dump_url_probe_cache(cls):
+        with cls._url_probe_lock:
+            cls.URL_PROBE_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            IOUtils.dump(cls.URL_PROBE_CACHE_FILE, cls._url_probe_cache, IOUtils.Format.json)
+
+    def get_github_top_repos(self) -> List[Project]:
         repositories = GitHubUtils.search_repos(q="topic:java language:java", sort="stars", order="desc",
                                                 max_num_repos=1000)
-        for repo in repositories:
-            project = Project()
-            project.url = GitHubUtils.ensure_github_api_call(lambda g: repo.clone_url)
-            project.data["user"] = GitHubUtils.ensure_github_api_call(lambda g: repo.owner.login)
-            project.data["repo"] = GitHubUtils.ensure_github_api_call(lambda g: repo.name)
-            project.full_name = f"{project.data['user']}_{project.data['repo']}"
-            project.data["branch"] = GitHubUtils.ensure_github_api_call(lambda g: repo.default_branch)
+        projects = [self._github_repo_to_project(repo) for repo in repositories]
+        # The search results are already loaded; the pom.xml probes are the per-repo round-trips worth overlapping
+        with ThreadPoolExecutor(16) as executor:
+            list(executor.map(self._probe_maven_project, projects))
+        return projects
+
+    @classmethod
+    def _github_repo_to_project(cls, repo) -> Project:
+        project = Project()
+        project.url = GitHubUtils.ensure_github_api_call(lambda g: repo.clone_url)
+        project.data["user"] = GitHubUtils.ensure_github_api_call(lambda g: repo.owner.login)
+        project.data["repo"] = GitHubUtils.ensure_github_api_call(lambda g: repo.name)
+        project.full_name = f"{project.data['user']}_{project.data['repo']}"
+        project.data["branch"] = GitHubUtils.ensure_github_api_call(lambda g: repo.default_branch)
+        return project
+
+    @classmethod
+    def _probe_maven_project(cls, project: Project):
+        """Sets project.data["maven"] to whether the repo has a pom.xml, or None if the probe failed."""
+        try:
+            project.data["maven"] = cls.check_maven_project(project.data["user"], project.data["repo"])
+        except Exception:
+            cls.logger.warning(f"Probing pom.xml of {project.full_name} failed, error was: {traceback.format_exc()}")
+            project.data["maven"] = None
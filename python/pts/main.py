@@ -64,8 +64,8 @@ ML_models = [
 # script for Download projects
 def clone_checkout_projects():
     from pts.collector.DataCollector import DataCollector
-    dc = DataCollector()
-    dc.download_projects(proj_logs)
+    with DataCollector() as dc:
+        dc.download_projects(proj_logs)
 
 
 # script to run pit
@@ -456,8 +456,8 @@ def collect_metrics(**options):
 # Collect data
 def collect_data(**options):
     from pts.collector.DataCollector import DataCollector
-    collector = DataCollector()
-    collector.collect_data(**options)
+    with DataCollector() as collector:
+        collector.collect_data(**options)
 
 
 #==========================
@@ -471,8 +471,8 @@ def collect_dependency_graph(**options):
 
 def collect_projs_for_mt(**options):
     from pts.collector.DataCollector import DataCollector
-    dc = DataCollector()
-    dc.collect_projects(Macros.results_dir/"projects-github.txt", True)
+    with DataCollector() as dc:
+        dc.collect_projects(Macros.results_dir/"projects-github.txt", True)
 
 
 def check_sha_first_time_failed_tests(**options):